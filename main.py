@@ -1,9 +1,18 @@
 import pygame
-import math
+import numpy as np
+import pandas as pd
 import csv
-import requests
+import gzip
+import hashlib
+import math
+import pickle
+import httpx
 import threading
 import os
+import queue
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 WIDTH, HEIGHT = 1700, 800
@@ -16,78 +25,269 @@ BG_COLOR = (240, 240, 240)
 LINE_COLOR = (200, 0, 0)
 STOP_COLOR = (0, 50, 200)
 GTFS_DIR = "gtfs"
+# Bump when the parsed GTFS structures change, invalidates gtfs/.parsed_* caches
+GTFS_CACHE_VERSION = 2
 CACHE_DIR = "cache_tiles"
+TILE_SIZE = 256
+MIN_ZOOM, MAX_ZOOM = 10, 19
+# Missing tiles are drawn from the tile this many levels up, scaled up
+FALLBACK_LEVELS = 3
+# Stop picking grid resolution: 2^14 cells per axis is 16px at MIN_ZOOM
+STOP_GRID = 1 << 14
+# Shapes are drawn aliased below this zoom
+AA_MIN_ZOOM = 13
+# Zoom levels with a pre-simplified copy of each shape (1px tolerance at that zoom)
+SHAPE_LODS = (10, 13, 16)
+# Shapes are stored as integer deltas on a 2^30 grid (1/8 px at zoom 19)
+SHAPE_QUANT_BITS = 30
+# RAM tile budget: about 4 viewports worth of 256x256 32-bit tiles
+TILE_CACHE_BYTES = 4 * (WIDTH // 256 + 2) * (HEIGHT // 256 + 2) * 256 * 256 * 4
+# Extra rows/columns of tiles requested around the viewport
+PRELOAD_MARGIN = 2
+# Max pending downloads: one frame's worth of tiles, the farthest from the view is dropped first
+MAX_QUEUE = ((-(-WIDTH // TILE_SIZE) + 1 + 2 * PRELOAD_MARGIN)
+             * (-(-HEIGHT // TILE_SIZE) + 1 + 2 * PRELOAD_MARGIN))
 
 # 
 def project(lat, lon):
-    sin_y = math.sin(lat * math.pi / 180)
-    sin_y = min(max(sin_y, -0.9999), 0.9999)
-    x = 0.5 + lon / 360
-    y = 0.5 - math.log((1 + sin_y) / (1 - sin_y)) / (4 * math.pi)
+    """Web Mercator projection to normalized world coords, works on scalars and numpy arrays"""
+    sin_y = np.clip(np.sin(np.asarray(lat) * np.pi / 180), -0.9999, 0.9999)
+    x = 0.5 + np.asarray(lon) / 360
+    y = 0.5 - np.log((1 + sin_y) / (1 - sin_y)) / (4 * np.pi)
     return x, y
 
+def simplify(pts, eps, bounds=()):
+    """Ramer-Douglas-Peucker simplification of the polylines packed in `pts` (split at `bounds`).
+    All open segments of all polylines are split in the same numpy pass, so the Python
+    loop runs once per recursion depth instead of once per segment."""
+    bounds = np.asarray(bounds, dtype=np.intp)
+    n = len(pts)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    keep[bounds] = True
+    keep[bounds - 1] = True
+    active = np.ones(n, dtype=bool)  # points whose segment may still need a split
+    active[keep] = False
+    while active.any():
+        idx = np.flatnonzero(active)
+        kept = np.flatnonzero(keep)
+        seg = np.searchsorted(kept, idx) - 1
+        start, end = kept[seg], kept[seg + 1]
+        d = pts[end] - pts[start]
+        rel = pts[idx] - pts[start]
+        seg_len = np.hypot(d[:, 0], d[:, 1])
+        cross = np.abs(d[:, 0] * rel[:, 1] - d[:, 1] * rel[:, 0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dist = np.where(seg_len == 0, np.hypot(rel[:, 0], rel[:, 1]), cross / seg_len)
+        # Farthest point of each segment (first one on ties, like argmax)
+        seg_max = np.full(len(kept), -1.0)
+        np.maximum.at(seg_max, seg, dist)
+        is_max = dist == seg_max[seg]
+        segs, first = np.unique(seg[is_max], return_index=True)
+        split = idx[is_max][first][seg_max[segs] > eps]
+        keep[split] = True
+        # Segments with nothing farther than eps are final
+        done = seg_max[seg] <= eps
+        active[idx[done]] = False
+        active[split] = False
+    kept_before = np.cumsum(keep)
+    new_bounds = kept_before[bounds - 1]
+    return np.split(pts[keep], new_bounds)
+
+def shape_lod(zoom):
+    """Coarsest simplified level that is still within 1px at this zoom, None for full detail"""
+    for level in SHAPE_LODS:
+        if zoom <= level:
+            return level
+    return None
+
+def encode_shape(pts):
+    """Quantize an (N, 2) polyline to (origin, deltas), deltas in int16 when they fit"""
+    q = np.round(pts * (1 << SHAPE_QUANT_BITS)).astype(np.int64)
+    deltas = np.diff(q, axis=0, prepend=q[:1])
+    small = np.abs(deltas).max() <= np.iinfo(np.int16).max
+    return q[0], deltas.astype(np.int16 if small else np.int32)
+
+def decode_shape(encoded, world_size, screen_tl_x, screen_tl_y):
+    """Rebuild the screen-space points of an encoded shape"""
+    origin, deltas = encoded
+    q = np.cumsum(deltas, axis=0, dtype=np.int64)
+    q += origin
+    pts_px = q * (world_size / (1 << SHAPE_QUANT_BITS))
+    pts_px[:, 0] -= screen_tl_x
+    pts_px[:, 1] -= screen_tl_y
+    return pts_px
+
+def surface_bytes(img):
+    return img.get_width() * img.get_height() * img.get_bytesize()
+
 class TileManager:
-    def __init__(self, workers=4):
-        self.cache = {}
-        self.queue = []
-        self.lock = threading.Lock()
-        self.session = requests.Session()
-        self.session.headers.update({"User-Agent": "OptymoMap/Turbo"})
+    def __init__(self, workers=8, max_bytes=TILE_CACHE_BYTES):
+        # One LRU for real tiles (x, y, z) and upscaled fallbacks ('fallback', x, y, z)
+        self.cache = OrderedDict()
+        self.bytes_used = 0
+        self.max_bytes = max_bytes
+        self.pending = {}  # key -> Future
+        # Viewport centre as (tile x, tile y, zoom), set by the render loop to rank pending requests
+        self.focus = None
+        # Surfaces decoded by the workers, waiting to be converted on the main thread
+        self.ready = queue.Queue()
+        # Reentrant: cancelling a future runs its done-callback in the calling thread
+        self.lock = threading.RLock()
+        # One shared client: over HTTP/2 every worker multiplexes on the same connection
+        self.client = httpx.Client(http2=True, headers={"User-Agent": "OptymoMap/Turbo"}, timeout=5.0,
+                                   limits=httpx.Limits(max_connections=16, max_keepalive_connections=16))
         
         Path(CACHE_DIR).mkdir(exist_ok=True)
+        # Names of the tiles already in the disk cache, saves a stat() per request
+        self.on_disk = set(os.listdir(CACHE_DIR))
         
-        self.workers = []
-        for _ in range(workers):
-            t = threading.Thread(target=self.worker, daemon=True)
-            t.start()
-            self.workers.append(t)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
 
     def get_tile(self, x, y, z):
         key = (x, y, z)
         
         if key in self.cache:
+            self.cache.move_to_end(key)
             return self.cache[key]
-        
-        filename = f"{CACHE_DIR}/{z}_{x}_{y}.png"
-        
-        if os.path.exists(filename):
-            try:
-                img = pygame.image.load(filename).convert()
-                self.cache[key] = img
-                return img
-            except:
-                pass 
 
+        self.request(key)
+        return self.get_fallback(x, y, z)
+
+    def prefetch(self, x, y, z):
+        """Make sure an off-screen tile is loaded or queued, without building a fallback for it"""
+        key = (x, y, z)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        else:
+            self.request(key)
+
+    def request(self, key):
+        """Queue a tile for loading, disk and network loads both happen on the workers (see drain())"""
+        x, y, z = key
         with self.lock:
-            if key not in self.queue:
-                self.queue.append(key)
-        
-        return None
+            if key not in self.pending:
+                if len(self.pending) >= MAX_QUEUE:
+                    # Drop the not yet started request farthest from the view, if farther than this one
+                    dist = self.distance(key)
+                    # Snapshot: cancel() runs _done right away, which deletes from pending
+                    for old_key, old_future in sorted(self.pending.items(), key=lambda kv: -self.distance(kv[0])):
+                        if self.distance(old_key) <= dist:
+                            break
+                        if old_future.cancel():
+                            break
+                if len(self.pending) < MAX_QUEUE:
+                    future = self.pool.submit(self._fetch, x, y, z)
+                    self.pending[key] = future
+                    future.add_done_callback(lambda f, key=key: self._done(key, f))
 
-    def worker(self):
-        while True:
-            task = None
-            with self.lock:
-                if self.queue:
-                    task = self.queue.pop(-1)
-            
-            if not task:
-                pygame.time.wait(20)
-                continue
-            
-            x, y, z = task
-            filename = f"{CACHE_DIR}/{z}_{x}_{y}.png"
-            
-            if os.path.exists(filename):
-                continue
+    def distance(self, key):
+        """Distance from a tile centre to the view centre, in tiles of the focused zoom"""
+        if self.focus is None:
+            return 0.0
+        x, y, z = key
+        fx, fy, fz = self.focus
+        scale = 2.0 ** (fz - z)
+        return math.hypot((x + 0.5) * scale - fx, (y + 0.5) * scale - fy)
 
+    def get_fallback(self, x, y, z):
+        """Low-res stand-in for a missing tile, cut from a coarser tile already in RAM"""
+        fb_key = ('fallback', x, y, z)
+        if fb_key in self.cache:
+            self.cache.move_to_end(fb_key)
+            return self.cache[fb_key]
+
+        cz = max(z - FALLBACK_LEVELS, MIN_ZOOM)
+        d = z - cz
+        if d == 0:
+            return None
+        coarse_key = (x >> d, y >> d, cz)
+        coarse = self.cache.get(coarse_key)
+        if coarse is None:
+            self.request(coarse_key)
+            return None
+        self.cache.move_to_end(coarse_key)
+
+        size = TILE_SIZE >> d
+        mask = (1 << d) - 1
+        sub = coarse.subsurface(pygame.Rect((x & mask) * size, (y & mask) * size, size, size))
+        img = pygame.transform.scale(sub, (TILE_SIZE, TILE_SIZE))
+        # Shares the LRU and byte budget of the real tiles
+        self.cache_put(fb_key, img)
+        return img
+
+    def preload(self, cam_x, cam_y, z, radius=2):
+        """Request the tiles of zoom `z` around a world position"""
+        n = 2 ** z
+        cx, cy = int(cam_x * n), int(cam_y * n)
+        for x in range(cx - radius, cx + radius + 1):
+            for y in range(cy - radius, cy + radius + 1):
+                if 0 <= y < n:
+                    self.request((x % n, y, z))
+
+    def drain(self, limit=16):
+        """Move up to `limit` decoded tiles into the RAM cache, returns how many arrived.
+        Must run on the main thread since convert() needs the display."""
+        count = 0
+        while count < limit:
+            try:
+                key, img = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.pending.pop(key, None)
+            stale = self.cache.pop(('fallback',) + key, None)
+            if stale is not None:
+                self.bytes_used -= surface_bytes(stale)
             try:
-                r = self.session.get(TILE_URL.format(x=x, y=y, z=z), timeout=5)
-                if r.status_code == 200:
-                    with open(filename, "wb") as f:
-                        f.write(r.content)
-            except Exception as e:
+                self.cache_put(key, img.convert())
+                count += 1
+            except pygame.error:
                 pass
+        return count
+
+    def clear_queue(self):
+        """Drop every pending download (e.g. tiles of a zoom level we just left)"""
+        with self.lock:
+            for future in list(self.pending.values()):
+                future.cancel()
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.client.close()
+
+    def cache_put(self, key, img):
+        """Insert a surface in the RAM cache, evicting least recently used tiles over budget"""
+        self.cache[key] = img
+        self.bytes_used += surface_bytes(img)
+        while self.bytes_used > self.max_bytes and len(self.cache) > 1:
+            _, old = self.cache.popitem(last=False)
+            self.bytes_used -= surface_bytes(old)
+
+    def _done(self, key, future):
+        # Successful loads stay pending until drain() picks them up, so they are not requested twice
+        if not future.cancelled() and future.result():
+            return
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    def _fetch(self, x, y, z):
+        name = f"{z}_{x}_{y}.png"
+        filename = f"{CACHE_DIR}/{name}"
+
+        try:
+            if name not in self.on_disk:
+                r = self.client.get(TILE_URL.format(x=x, y=y, z=z))
+                if r.status_code != 200:
+                    return False
+                with open(filename, "wb") as f:
+                    f.write(r.content)
+                self.on_disk.add(name)
+            self.ready.put(((x, y, z), pygame.image.load(filename)))
+            return True
+        except Exception as e:
+            return False
 
 def load_trips_routes_calendar():
     """Load trips, routes, and calendar data"""
@@ -139,50 +339,35 @@ def load_stop_times(trips, calendar):
     """Load stop times indexed by stop_id, organized by route and day"""
     stop_times = {}
     try:
-        with open(f"{GTFS_DIR}/stop_times.txt", encoding='utf-8-sig') as f:
-            for row in csv.DictReader(f):
-                stop_id = row['stop_id']
-                trip_id = row['trip_id']
-                
-                if trip_id not in trips:
-                    continue
-                
-                trip_info = trips[trip_id]
-                route_id = trip_info['route_id']
-                service_id = trip_info['service_id']
-                
-                if service_id not in calendar:
-                    continue
-                
-                service = calendar[service_id]
-                departure_time = row['departure_time']
-                
-                if stop_id not in stop_times:
-                    stop_times[stop_id] = {}
-                if route_id not in stop_times[stop_id]:
-                    stop_times[stop_id][route_id] = {'weekday': [], 'saturday': [], 'sunday': []}
-                
-                is_weekday = any(service[day] == '1' for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday'])
-                is_saturday = service['saturday'] == '1'
-                is_sunday = service['sunday'] == '1'
-                
-                if is_weekday:
-                    stop_times[stop_id][route_id]['weekday'].append(departure_time)
-                if is_saturday:
-                    stop_times[stop_id][route_id]['saturday'].append(departure_time)
-                if is_sunday:
-                    stop_times[stop_id][route_id]['sunday'].append(departure_time)
+        df = pd.read_csv(f"{GTFS_DIR}/stop_times.txt", encoding='utf-8-sig', dtype=str, keep_default_na=False,
+                         usecols=['trip_id', 'stop_id', 'departure_time'])
+        df['route_id'] = df['trip_id'].map({trip_id: t['route_id'] for trip_id, t in trips.items()})
+        df['service_id'] = df['trip_id'].map({trip_id: t['service_id'] for trip_id, t in trips.items()})
+        # Unknown trips map to NaN and drop out here too
+        df = df[df['service_id'].isin(calendar.keys())]
+
+        for stop_id, route_id in df[['stop_id', 'route_id']].drop_duplicates().itertuples(index=False):
+            stop_times.setdefault(stop_id, {})[route_id] = {'weekday': (), 'saturday': (), 'sunday': ()}
+
+        day_services = {
+            'weekday': {sid for sid, svc in calendar.items()
+                        if any(svc[day] == '1' for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday'])},
+            'saturday': {sid for sid, svc in calendar.items() if svc['saturday'] == '1'},
+            'sunday': {sid for sid, svc in calendar.items() if svc['sunday'] == '1'},
+        }
+        for day_type, services in day_services.items():
+            day_df = df[df['service_id'].isin(services)].sort_values('departure_time', kind='mergesort')
+            # Tuples (already sorted) so format_times_table can be memoized
+            grouped = day_df.groupby(['stop_id', 'route_id'], sort=False)['departure_time'].agg(tuple)
+            for (stop_id, route_id), times in grouped.items():
+                stop_times[stop_id][route_id][day_type] = times
     
     except Exception as e:
         print(f"Error loading stop_times.txt: {e}")
     
-    for stop_id in stop_times:
-        for route_id in stop_times[stop_id]:
-            for day_type in ['weekday', 'saturday', 'sunday']:
-                stop_times[stop_id][route_id][day_type].sort()
-    
     return stop_times
 
+@lru_cache(maxsize=1024)
 def format_times_table(times_list):
     """Convert list of times (HH:MM:SS) into a grid format {hour: [minutes]}"""
     grid = {h: [] for h in range(6, 23)}
@@ -203,38 +388,91 @@ def load_gtfs_data():
     stop_info = {}
     print("Chargement GTFS...")
     try:
-        with open(f"{GTFS_DIR}/shapes.txt", encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            current_shape_id = None
-            pts = []
-            for row in sorted(list(reader), key=lambda r: (r['shape_id'], int(r['shape_pt_sequence']))):
-                sid = row['shape_id']
-                x, y = project(float(row['shape_pt_lat']), float(row['shape_pt_lon']))
-                if sid != current_shape_id:
-                    if pts: shapes.append(pts)
-                    current_shape_id = sid
-                    pts = []
-                pts.append((x, y))
-            if pts: shapes.append(pts)
+        df = pd.read_csv(f"{GTFS_DIR}/shapes.txt", encoding='utf-8-sig', float_precision='round_trip',
+                         dtype={'shape_id': str, 'shape_pt_sequence': 'int64',
+                                'shape_pt_lat': 'float64', 'shape_pt_lon': 'float64'})
+        if len(df):
+            # Feeds almost always list each shape contiguously and in sequence order,
+            # only pay for the global sort when that O(N) check fails
+            ids = df['shape_id'].to_numpy()
+            seq = df['shape_pt_sequence'].to_numpy()
+            same = ids[1:] == ids[:-1]
+            runs = len(ids) - int(same.sum())
+            if runs != df['shape_id'].nunique() or not np.all(seq[1:][same] > seq[:-1][same]):
+                df.sort_values(['shape_id', 'shape_pt_sequence'], kind='mergesort', inplace=True)
+                ids = df['shape_id'].to_numpy()
+            pts = np.column_stack(project(df['shape_pt_lat'].to_numpy(), df['shape_pt_lon'].to_numpy()))
+            # Split the projected points wherever shape_id changes
+            bounds = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+            simplified = {level: simplify(pts, 1 / (2 ** level * TILE_SIZE), bounds) for level in SHAPE_LODS}
+            # Keep each shape with its world-space bounding box for cheap culling
+            for i, shape in enumerate(np.split(pts, bounds)):
+                (xmin, ymin), (xmax, ymax) = shape.min(axis=0), shape.max(axis=0)
+                lods = {None: encode_shape(shape)}
+                for level in SHAPE_LODS:
+                    lods[level] = encode_shape(simplified[level][i])
+                shapes.append((lods, float(xmin), float(ymin), float(xmax), float(ymax)))
     except: print("Pas de shapes.txt")
 
     try:
-        with open(f"{GTFS_DIR}/stops.txt", encoding='utf-8-sig') as f:
-            for row in csv.DictReader(f):
-                stop_id = row['stop_id']
-                lat, lon = float(row['stop_lat']), float(row['stop_lon'])
-                x, y = project(lat, lon)
-                stops.append((x, y, stop_id))
-                stop_info[stop_id] = {
-                    'name': row['stop_name'],
-                    'lat': lat,
-                    'lon': lon,
-                    'x': x,
-                    'y': y
-                }
+        df = pd.read_csv(f"{GTFS_DIR}/stops.txt", encoding='utf-8-sig', float_precision='round_trip',
+                         dtype={'stop_id': str, 'stop_name': str, 'stop_lat': 'float64', 'stop_lon': 'float64'},
+                         keep_default_na=False, usecols=['stop_id', 'stop_name', 'stop_lat', 'stop_lon'])
+        lats, lons = df['stop_lat'].to_numpy(), df['stop_lon'].to_numpy()
+        xs, ys = project(lats, lons)
+        for stop_id, name, lat, lon, x, y in zip(df['stop_id'], df['stop_name'], lats.tolist(), lons.tolist(),
+                                                  xs.tolist(), ys.tolist()):
+            stops.append((x, y, stop_id))
+            stop_info[stop_id] = {
+                'name': name,
+                'lat': lat,
+                'lon': lon,
+                'x': x,
+                'y': y
+            }
     except: pass
     return shapes, stops, stop_info
 
+def gtfs_cache_path():
+    """Parsed-data cache file, keyed by the mtimes of the GTFS files and the cache format"""
+    key = hashlib.md5(str(GTFS_CACHE_VERSION).encode())
+    for name in sorted(os.listdir(GTFS_DIR)):
+        if name.endswith(".txt"):
+            key.update(f"{name}:{os.path.getmtime(os.path.join(GTFS_DIR, name))}".encode())
+    return os.path.join(GTFS_DIR, f".parsed_{key.hexdigest()}.pkl.gz")
+
+def load_all_gtfs():
+    """Load every GTFS table, from the parsed cache when the feed has not changed"""
+    try:
+        cache_file = gtfs_cache_path()
+    except OSError as e:
+        # No readable feed directory: let the loaders report the missing files, skip the cache
+        print(f"Error reading {GTFS_DIR}: {e}")
+        cache_file = None
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with gzip.open(cache_file, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"Error loading GTFS cache: {e}")
+
+    trips, routes, calendar = load_trips_routes_calendar()
+    shapes, stops, stop_info = load_gtfs_data()
+    stop_times = load_stop_times(trips, calendar)
+    data = (trips, routes, calendar, shapes, stops, stop_info, stop_times)
+    if cache_file is None:
+        return data
+
+    try:
+        # Drop caches of older versions of the feed
+        for old in Path(GTFS_DIR).glob(".parsed_*.pkl.gz"):
+            old.unlink()
+        with gzip.open(cache_file, "wb", compresslevel=1) as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        print(f"Error writing GTFS cache: {e}")
+    return data
+
 # ================= MAIN =================
 def main():
     pygame.init()
@@ -244,26 +482,121 @@ def main():
     font = pygame.font.SysFont("Arial", 16, bold=True)
     small_font = pygame.font.SysFont("Arial", 11)
     tiny_font = pygame.font.SysFont("Arial", 9)
+    title_font = pygame.font.SysFont("Arial", 13, bold=True)
 
-    tile_manager = TileManager(workers=4)
-    trips, routes, calendar = load_trips_routes_calendar()
-    gtfs_shapes, gtfs_stops_raw, stop_info = load_gtfs_data()
-    stop_times = load_stop_times(trips, calendar)
+    tile_manager = TileManager(workers=8)
+    trips, routes, calendar, gtfs_shapes, gtfs_stops_raw, stop_info, stop_times = load_all_gtfs()
     
     gtfs_stops = [(sx, sy, sid) for sx, sy, sid in gtfs_stops_raw if sid in stop_times]
     print(f"Loaded {len(gtfs_stops)} stops with service (filtered from {len(gtfs_stops_raw)})")
+    # SoA copy of the stops for the per-frame vectorized transform and cull
+    stops_x = np.fromiter((s[0] for s in gtfs_stops), dtype=np.float64, count=len(gtfs_stops))
+    stops_y = np.fromiter((s[1] for s in gtfs_stops), dtype=np.float64, count=len(gtfs_stops))
+    stop_ids = np.array([s[2] for s in gtfs_stops], dtype=object)
+    # Grid index for click picking, cell (i, j) covers [i/STOP_GRID, (i+1)/STOP_GRID) in world units
+    stop_grid = defaultdict(list)
+    for sx, sy, stop_id in gtfs_stops:
+        stop_grid[(int(sx * STOP_GRID), int(sy * STOP_GRID))].append((sx, sy, stop_id))
 
-    cam_x, cam_y = project(START_LAT, START_LON)
+    cam_x, cam_y = (float(v) for v in project(START_LAT, START_LON))
+    # Coarsest level is only a handful of tiles, it backs the low-res fallback
+    tile_manager.preload(cam_x, cam_y, MIN_ZOOM)
     zoom = START_ZOOM
     dragging = False
     last_mouse_pos = (0, 0)
     selected_stop_id = None
 
-    PRELOAD_MARGIN = 2 
-    TILE_SIZE = 256
     STOP_RADIUS = 8
 
+    def make_stop_sprite(color):
+        sprite = pygame.Surface((2 * STOP_RADIUS + 2, 2 * STOP_RADIUS + 2), pygame.SRCALPHA)
+        pygame.draw.circle(sprite, color, (STOP_RADIUS + 1, STOP_RADIUS + 1), STOP_RADIUS)
+        return sprite.convert_alpha()
+
+    # Rasterized once, blitted for every visible stop
+    stop_sprite = make_stop_sprite(STOP_COLOR)
+    selected_sprite = make_stop_sprite((255, 200, 0))
+    sprite_offset = STOP_RADIUS + 1
+
+    PANEL_WIDTH = 400
+    panel_x = WIDTH - PANEL_WIDTH
+    panel_cache = {}  # selected stop_id -> pre-rendered panel Surface
+
+    def render_panel(stop_id):
+        """Draw the schedule panel of a stop (or the idle hint) into its own Surface"""
+        surf = pygame.Surface((PANEL_WIDTH, HEIGHT))
+        surf.fill((30, 30, 50))
+        pygame.draw.line(surf, (100, 100, 150), (0, 0), (0, HEIGHT), 2)
+        
+        if stop_id and stop_id in stop_info:
+            stop = stop_info[stop_id]
+            routes_data = stop_times.get(stop_id, {})
+        
+            title = title_font.render(stop['name'][:35], True, (255, 255, 255))
+            surf.blit(title, (8, 8))
+        
+            y_offset = 28
+            for route_id in sorted(routes_data.keys()):
+                if y_offset > HEIGHT - 180:
+                    break
+            
+                route_info = routes.get(route_id, {'short_name': route_id, 'color': '#FF0000'})
+                route_name = route_info['short_name']
+                route_color_hex = route_info['color'].lstrip('#')
+                route_color = tuple(int(route_color_hex[i:i+2], 16) for i in (0, 2, 4))
+            
+                times_data = routes_data[route_id]
+            
+                header_rect = pygame.Rect(6, y_offset, PANEL_WIDTH - 12, 18)
+                pygame.draw.rect(surf, route_color, header_rect)
+                route_label = small_font.render(f"Line {route_name}", True, (255, 255, 255))
+                surf.blit(route_label, (10, y_offset + 2))
+                y_offset += 20
+            
+                day_types = [('Weekdays', 'weekday'), ('Saturday', 'saturday'), ('Sunday', 'sunday')]
+                for day_label, day_key in day_types:
+                    times_list = times_data[day_key]
+                    if times_list:
+                        day_text = tiny_font.render(day_label + ":", True, (200, 200, 220))
+                        surf.blit(day_text, (10, y_offset))
+                        y_offset += 12
+                    
+                        grid = format_times_table(times_list)
+                    
+                        x_pos = 12
+                        col_width = 28
+                        for h in range(6, 23):
+                            h_text = tiny_font.render(str(h), True, (150, 150, 200))
+                            surf.blit(h_text, (x_pos + (h - 6) * col_width, y_offset))
+                        y_offset += 12
+                    
+                        max_mins_in_column = max(len(grid[h]) for h in range(6, 23)) if grid else 0
+                        for row in range(max_mins_in_column):
+                            x_pos = 12
+                            for h in range(6, 23):
+                                if row < len(grid[h]):
+                                    min_val = grid[h][row]
+                                    min_text = tiny_font.render(f"{min_val:02d}", True, (100, 200, 100))
+                                    surf.blit(min_text, (x_pos + (h - 6) * col_width, y_offset))
+                            y_offset += 10
+                    
+                        y_offset += 4
+            
+                y_offset += 3
+        else:
+            no_select = small_font.render("Click a stop", True, (150, 150, 180))
+            surf.blit(no_select, (10, 20))
+            no_select2 = small_font.render("for details", True, (150, 150, 180))
+            surf.blit(no_select2, (10, 40))
+        return surf.convert()
+
     running = True
+    # Only recompose the frame when something visible changed
+    dirty = True
+    # Bumped whenever cam_x/cam_y/zoom change, screen-space caches are keyed on it
+    cam_epoch = 0
+    shapes_epoch = -1
+    shapes_px = []  # visible shapes in screen space, as point lists ready for aalines
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT: 
@@ -272,25 +605,40 @@ def main():
                 if event.button == 1:
                     mouse_x, mouse_y = event.pos
                     
-                    if mouse_x < WIDTH - 400:
+                    if mouse_x < panel_x:
                         n = 2 ** zoom
                         world_size = n * TILE_SIZE
                         screen_tl_x = (cam_x * world_size) - (WIDTH / 2)
                         screen_tl_y = (cam_y * world_size) - (HEIGHT / 2)
                         
                         selected_stop_id = None
-                        for sx, sy, stop_id in gtfs_stops:
-                            px = int((sx * world_size) - screen_tl_x)
-                            py = int((sy * world_size) - screen_tl_y)
-                            dist = math.sqrt((px - mouse_x)**2 + (py - mouse_y)**2)
-                            if dist <= STOP_RADIUS + 5:
-                                selected_stop_id = stop_id
-                                break
+                        pick_radius = STOP_RADIUS + 5
+                        best = pick_radius * pick_radius
+                        # Only visit the grid cells the pick radius can reach
+                        wx0 = (mouse_x - pick_radius + screen_tl_x) / world_size
+                        wx1 = (mouse_x + pick_radius + screen_tl_x) / world_size
+                        wy0 = (mouse_y - pick_radius + screen_tl_y) / world_size
+                        wy1 = (mouse_y + pick_radius + screen_tl_y) / world_size
+                        for i in range(int(wx0 * STOP_GRID), int(wx1 * STOP_GRID) + 1):
+                            for j in range(int(wy0 * STOP_GRID), int(wy1 * STOP_GRID) + 1):
+                                for sx, sy, stop_id in stop_grid.get((i, j), ()):
+                                    dx = (sx * world_size) - screen_tl_x - mouse_x
+                                    dy = (sy * world_size) - screen_tl_y - mouse_y
+                                    d2 = dx * dx + dy * dy
+                                    if d2 <= best:
+                                        best = d2
+                                        selected_stop_id = stop_id
                     else:
                         selected_stop_id = None
                     dragging, last_mouse_pos = True, event.pos
-                elif event.button == 4: zoom = min(zoom + 1, 19)
-                elif event.button == 5: zoom = max(zoom - 1, 10)
+                    dirty = True
+                elif event.button in (4, 5):
+                    new_zoom = min(zoom + 1, MAX_ZOOM) if event.button == 4 else max(zoom - 1, MIN_ZOOM)
+                    if new_zoom != zoom:
+                        zoom = new_zoom
+                        tile_manager.clear_queue()
+                        cam_epoch += 1
+                        dirty = True
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1: dragging = False
             elif event.type == pygame.MOUSEMOTION and dragging:
@@ -299,6 +647,19 @@ def main():
                 cam_x -= dx / world_scale
                 cam_y -= dy / world_scale
                 last_mouse_pos = event.pos
+                if dx or dy:
+                    cam_epoch += 1
+                    dirty = True
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                dirty = True
+
+        if tile_manager.drain():
+            dirty = True
+
+        if not dirty:
+            clock.tick(FPS)
+            continue
+        dirty = False
 
         screen.fill(BG_COLOR)
 
@@ -312,106 +673,80 @@ def main():
         start_row = int(screen_tl_y / TILE_SIZE) - PRELOAD_MARGIN
         end_row = int((screen_tl_y + HEIGHT) / TILE_SIZE) + 1 + PRELOAD_MARGIN
 
-        for col in range(start_col, end_col):
-            for row in range(start_row, end_row):
-                tile_col = col % n
-                tile_row = row 
-                
-                if 0 <= tile_row < n:
-                    img = tile_manager.get_tile(tile_col, tile_row, zoom)
-                    
-                    draw_x = (col * TILE_SIZE) - screen_tl_x
-                    draw_y = (row * TILE_SIZE) - screen_tl_y
-                    
-                    if -TILE_SIZE < draw_x < WIDTH and -TILE_SIZE < draw_y < HEIGHT:
-                        if img:
-                            screen.blit(img, (draw_x, draw_y))
-                        else:
-                            pygame.draw.rect(screen, BG_COLOR, (draw_x, draw_y, TILE_SIZE, TILE_SIZE))
-
-        if gtfs_shapes:
-            for shape in gtfs_shapes:
-                points_px = [((sx * world_size) - screen_tl_x, (sy * world_size) - screen_tl_y) for sx, sy in shape]
-                if any(-50 < p[0] < WIDTH+50 and -50 < p[1] < HEIGHT+50 for p in points_px):
-                    if len(points_px) > 1: pygame.draw.aalines(screen, LINE_COLOR, False, points_px)
+        # Nearest tiles first, so on-screen tiles are queued before the preload margin
+        center_x = (screen_tl_x + WIDTH / 2) / TILE_SIZE
+        center_y = (screen_tl_y + HEIGHT / 2) / TILE_SIZE
+        tile_manager.focus = (center_x, center_y, zoom)
+        grid_cells = [(col, row) for col in range(start_col, end_col) for row in range(start_row, end_row)
+                      if 0 <= row < n]
+        grid_cells.sort(key=lambda c: (c[0] + 0.5 - center_x) ** 2 + (c[1] + 0.5 - center_y) ** 2)
+
+        blit_list = []
+        append = blit_list.append
+        for col, row in grid_cells:
+            draw_x = (col * TILE_SIZE) - screen_tl_x
+            draw_y = (row * TILE_SIZE) - screen_tl_y
+
+            if -TILE_SIZE < draw_x < WIDTH and -TILE_SIZE < draw_y < HEIGHT:
+                img = tile_manager.get_tile(col % n, row, zoom)
+                if img is not None:
+                    append((img, (draw_x, draw_y)))
+            else:
+                # Preload margin: fetch only, it is never drawn
+                tile_manager.prefetch(col % n, row, zoom)
+        # Single batched blit; the background is already cleared by screen.fill
+        screen.blits(blit_list, doreturn=False)
+
+        if gtfs_shapes and shapes_epoch != cam_epoch:
+            shapes_epoch = cam_epoch
+            shapes_px = []
+            # Viewport in normalized world units, with the same 50px margin as before
+            vx0 = (screen_tl_x - 50) / world_size
+            vx1 = (screen_tl_x + WIDTH + 50) / world_size
+            vy0 = (screen_tl_y - 50) / world_size
+            vy1 = (screen_tl_y + HEIGHT + 50) / world_size
+            lod = shape_lod(zoom)
+            for lods, xmin, ymin, xmax, ymax in gtfs_shapes:
+                if xmax < vx0 or xmin > vx1 or ymax < vy0 or ymin > vy1:
+                    continue
+                shape = lods[lod]
+                if len(shape[1]) < 2:
+                    continue
+                shapes_px.append(decode_shape(shape, world_size, screen_tl_x, screen_tl_y).tolist())
+        # Anti-aliasing is invisible when zoomed out, plain lines are much cheaper
+        draw_lines = pygame.draw.lines if zoom < AA_MIN_ZOOM else pygame.draw.aalines
+        for pts_px in shapes_px:
+            draw_lines(screen, LINE_COLOR, False, pts_px)
 
         if zoom >= 14:
-            for sx, sy, stop_id in gtfs_stops:
-                px, py = int((sx * world_size) - screen_tl_x), int((sy * world_size) - screen_tl_y)
-                if -STOP_RADIUS < px < WIDTH + STOP_RADIUS and -STOP_RADIUS < py < HEIGHT + STOP_RADIUS:
-                    color = (255, 200, 0) if stop_id == selected_stop_id else STOP_COLOR
-                    pygame.draw.circle(screen, color, (px, py), STOP_RADIUS)
-
-        panel_width = 400
-        panel_x = WIDTH - panel_width
-        pygame.draw.rect(screen, (30, 30, 50), (panel_x, 0, panel_width, HEIGHT))
-        pygame.draw.line(screen, (100, 100, 150), (panel_x, 0), (panel_x, HEIGHT), 2)
-        
-        if selected_stop_id and selected_stop_id in stop_info:
-            stop = stop_info[selected_stop_id]
-            routes_data = stop_times.get(selected_stop_id, {})
-            
-            title = pygame.font.SysFont("Arial", 13, bold=True).render(stop['name'][:35], True, (255, 255, 255))
-            screen.blit(title, (panel_x + 8, 8))
-            
-            y_offset = 28
-            for route_id in sorted(routes_data.keys()):
-                if y_offset > HEIGHT - 180:
-                    break
-                
-                route_info = routes.get(route_id, {'short_name': route_id, 'color': '#FF0000'})
-                route_name = route_info['short_name']
-                route_color_hex = route_info['color'].lstrip('#')
-                route_color = tuple(int(route_color_hex[i:i+2], 16) for i in (0, 2, 4))
-                
-                times_data = routes_data[route_id]
-                
-                header_rect = pygame.Rect(panel_x + 6, y_offset, panel_width - 12, 18)
-                pygame.draw.rect(screen, route_color, header_rect)
-                route_label = small_font.render(f"Line {route_name}", True, (255, 255, 255))
-                screen.blit(route_label, (panel_x + 10, y_offset + 2))
-                y_offset += 20
-                
-                day_types = [('Weekdays', 'weekday'), ('Saturday', 'saturday'), ('Sunday', 'sunday')]
-                for day_label, day_key in day_types:
-                    times_list = times_data[day_key]
-                    if times_list:
-                        day_text = tiny_font.render(day_label + ":", True, (200, 200, 220))
-                        screen.blit(day_text, (panel_x + 10, y_offset))
-                        y_offset += 12
-                        
-                        grid = format_times_table(times_list)
-                        
-                        x_pos = panel_x + 12
-                        col_width = 28
-                        for h in range(6, 23):
-                            h_text = tiny_font.render(str(h), True, (150, 150, 200))
-                            screen.blit(h_text, (x_pos + (h - 6) * col_width, y_offset))
-                        y_offset += 12
-                        
-                        max_mins_in_column = max(len(grid[h]) for h in range(6, 23)) if grid else 0
-                        for row in range(max_mins_in_column):
-                            x_pos = panel_x + 12
-                            for h in range(6, 23):
-                                if row < len(grid[h]):
-                                    min_val = grid[h][row]
-                                    min_text = tiny_font.render(f"{min_val:02d}", True, (100, 200, 100))
-                                    screen.blit(min_text, (x_pos + (h - 6) * col_width, y_offset))
-                            y_offset += 10
-                        
-                        y_offset += 4
-                
-                y_offset += 3
-        else:
-            no_select = small_font.render("Click a stop", True, (150, 150, 180))
-            screen.blit(no_select, (panel_x + 10, 20))
-            no_select2 = small_font.render("for details", True, (150, 150, 180))
-            screen.blit(no_select2, (panel_x + 10, 40))
+            px = stops_x * world_size - screen_tl_x
+            py = stops_y * world_size - screen_tl_y
+            mask = (px > -STOP_RADIUS) & (px < WIDTH + STOP_RADIUS) & (py > -STOP_RADIUS) & (py < HEIGHT + STOP_RADIUS)
+            visible = np.flatnonzero(mask)
+            vis_x = (px[visible].astype(int) - sprite_offset).tolist()
+            vis_y = (py[visible].astype(int) - sprite_offset).tolist()
+            selected_pos = None
+            stop_blits = []
+            for i, sx, sy in zip(visible.tolist(), vis_x, vis_y):
+                if stop_ids[i] == selected_stop_id:
+                    selected_pos = (sx, sy)
+                else:
+                    stop_blits.append((stop_sprite, (sx, sy)))
+            screen.blits(stop_blits, doreturn=False)
+            if selected_pos is not None:
+                screen.blit(selected_sprite, selected_pos)
+
+        if selected_stop_id not in panel_cache:
+            if len(panel_cache) >= 16:
+                panel_cache.pop(next(iter(panel_cache)))
+            panel_cache[selected_stop_id] = render_panel(selected_stop_id)
+        screen.blit(panel_cache[selected_stop_id], (panel_x, 0))
 
         screen.blit(font.render(f"Z: {zoom} | FPS: {int(clock.get_fps())}", True, (50, 50, 50)), (10, 10))
         pygame.display.flip()
         clock.tick(FPS)
 
+    tile_manager.close()
     pygame.quit()
 
 if __name__ == '__main__':